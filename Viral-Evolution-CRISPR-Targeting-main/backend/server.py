@@ -1,35 +1,202 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import functools
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, FrozenSet, Optional, Tuple
 import uuid
 from datetime import datetime
 import io
 
 # BioPython imports
 from Bio import SeqIO
-from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 
 # ML and analysis imports
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import LabelEncoder
-import re
 import json
+import orjson
 
-# Helper function to calculate GC content
-def calculate_gc_content(sequence):
-    """Calculate GC content as a percentage"""
-    gc_count = sequence.count('G') + sequence.count('C')
-    return (gc_count / len(sequence)) * 100 if len(sequence) > 0 else 0
+try:
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# Lookup table for unambiguous bases (the N of an NGG PAM)
+_IS_ACGT = np.zeros(256, dtype=bool)
+_IS_ACGT[list(b'ACGT')] = True
+
+# Lookup table for characters allowed in an uploaded sequence
+_IS_VALID_BASE = np.zeros(256, dtype=bool)
+_IS_VALID_BASE[list(b'ATCGN')] = True
+
+# Lookup table mapping each base to its complement
+COMPLEMENT = np.zeros(256, dtype=np.uint8)
+COMPLEMENT[list(b'ATCGN')] = list(b'TAGCN')
+
+# Bases a simulated point mutation can introduce
+MUTATION_BASES = np.frombuffer(b'ATCG', dtype=np.uint8)
+
+# 3-bit base codes for packed comparison; N keeps its own code and anything
+# else (including head padding) maps to a code no base uses
+_CODE_BITS = 3
+_BASE_CODE = np.full(256, 7, dtype=np.uint8)
+_BASE_CODE[list(b'ACGTN')] = [0, 1, 2, 3, 4]
+
+# Random generator for mutation simulation
+_RNG = np.random.default_rng()
+
+def _encode_sequence(sequence: str) -> np.ndarray:
+    """Encode a nucleotide string as a uint8 array of ASCII codes"""
+    return np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+
+def _is_valid_sequence(seq_arr: np.ndarray) -> bool:
+    """Check that an encoded sequence is non-empty and only contains ATCGN"""
+    return len(seq_arr) > 0 and bool(_IS_VALID_BASE[seq_arr].all())
+
+def _pack_bases(arr: np.ndarray) -> np.ndarray:
+    """Pack each row of an encoded 2-D array into one uint64 of 3-bit base codes.
+
+    The first base lands in the most significant code, so equal k-mers at
+    different offsets differ only by a shift.
+    """
+    length = arr.shape[1]
+    if length * _CODE_BITS > 64:
+        raise ValueError(f"Cannot pack {length} bases into 64 bits")
+    codes = _BASE_CODE[arr].astype(np.uint64)
+    shifts = np.arange(length - 1, -1, -1, dtype=np.uint64) * np.uint64(_CODE_BITS)
+    return np.bitwise_or.reduce(codes << shifts, axis=1)
+
+def _variant_heads(variant_arrays: List[np.ndarray], length: int) -> np.ndarray:
+    """Stack the leading bases of each encoded variant, zero-padding short ones"""
+    heads = np.zeros((len(variant_arrays), length), dtype=np.uint8)
+    for v, variant in enumerate(variant_arrays):
+        heads[v, :min(len(variant), length)] = variant[:length]
+    return heads
+
+def _variant_kmers(variant_arrays: List[np.ndarray], length: int) -> List[FrozenSet[int]]:
+    """Index every k-mer of each encoded variant by its packed code"""
+    return [
+        frozenset(_pack_bases(sliding_window_view(variant, length)).tolist()) if len(variant) >= length else frozenset()
+        for variant in variant_arrays
+    ]
+
+def _decode_rows(arr: np.ndarray) -> List[str]:
+    """Decode each row of a 2-D uint8 array back into a string"""
+    rows = np.ascontiguousarray(arr).view(f'S{arr.shape[1]}').ravel()
+    return [row.decode('ascii') for row in rows]
+
+# Length of a Cas9 protospacer target
+TARGET_LEN = 20
+
+# Bump whenever target extraction changes so cached targets are recomputed
+TARGETS_VERSION = 1
+
+def _pack_targets(targets: Dict[str, np.ndarray]) -> bytes:
+    """Serialize extracted target arrays for storage on the sequence document"""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **targets)
+    return buf.getvalue()
+
+def _unpack_targets(blob: bytes) -> Dict[str, np.ndarray]:
+    """Restore target arrays serialized by _pack_targets"""
+    with np.load(io.BytesIO(blob)) as data:
+        return {key: data[key] for key in data.files}
+
+if _HAS_NUMBA:
+    @njit(cache=True)
+    def _popcount64(x):
+        """Count the set bits of a uint64 (SWAR, lowered to a single popcount by LLVM)"""
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+    @functools.lru_cache(maxsize=None)
+    def make_scorer(target_len: int):
+        """Build a target scoring kernel specialized for one target length.
+
+        The length is a compile-time constant inside the kernel, so Numba can
+        unroll the per-base loops. Targets and variant heads are passed packed
+        by _pack_bases. Closures cannot use Numba's on-disk cache, so each
+        length is compiled once per process and memoized here.
+        """
+        # Lowest bit of every base code, and the bits of one 4-mer
+        low_bits = np.uint64(sum(1 << (_CODE_BITS * k) for k in range(target_len)))
+        kmer_mask = np.uint64((1 << (4 * _CODE_BITS)) - 1)
+        
+        @njit(parallel=True)
+        def score_all_targets(target_codes, head_codes, present, gc_content):
+            """Conservation, escape probability and binding strength of each target"""
+            n_targets = len(target_codes)
+            n_variants = len(head_codes)
+            conservation = np.empty(n_targets)
+            escape_probs = np.empty(n_targets)
+            binding_strengths = np.empty(n_targets)
+            for i in prange(n_targets):
+                code = target_codes[i]
+                
+                # Targets not found are scored by similarity to the start of each variant
+                total = 0.0
+                for v in range(n_variants):
+                    if present[i, v]:
+                        total += 1.0
+                    else:
+                        diff = code ^ head_codes[v]
+                        # Fold each differing base code down to one bit
+                        mismatches = _popcount64((diff | (diff >> np.uint64(1)) | (diff >> np.uint64(2))) & low_bits)
+                        total += (target_len - mismatches) / target_len
+                conservation[i] = total / n_variants
+                
+                # 4-mers that recur at least 4 bp downstream
+                repeats = 0
+                for a in range(target_len - 3):
+                    kmer = (code >> np.uint64(_CODE_BITS * (target_len - 4 - a))) & kmer_mask
+                    for b in range(a + 4, target_len - 3):
+                        if ((code >> np.uint64(_CODE_BITS * (target_len - 4 - b))) & kmer_mask) == kmer:
+                            repeats += 1
+                            break
+                
+                # Same heuristics as CRISPRAnalyzer.score_all
+                gc_penalty = abs(gc_content[i] - 50) / 50
+                escape_probs[i] = min(1.0, max(0.0, 1.0 - ((1.0 - gc_penalty) * 0.3 + conservation[i] * 0.7)))
+                binding_strengths[i] = min(1.0, max(0.0, 1.0 - gc_penalty * 0.3 - repeats * 0.1 * 0.2))
+            return conservation, escape_probs, binding_strengths
+        
+        return score_all_targets
+
+    @njit(cache=True)
+    def _mutation_kernel(buf, draws, positions, base_choices, mutation_rate, bases):
+        """Apply pre-drawn mutations to buf in place, returning (generation, position, from, to) rows"""
+        mutations = np.empty((len(draws), 4), np.int32)
+        count = 0
+        for gen in range(len(draws)):
+            if draws[gen] < mutation_rate:
+                pos = positions[gen]
+                old_base = buf[pos]
+                new_base = bases[base_choices[gen]]
+                if old_base != new_base:
+                    buf[pos] = new_base
+                    mutations[count, 0] = gen
+                    mutations[count, 1] = pos
+                    mutations[count, 2] = old_base
+                    mutations[count, 3] = new_base
+                    count += 1
+        return mutations[:count]
+
+    # Compile (or load from cache) at import rather than on the first request
+    make_scorer(TARGET_LEN)(np.zeros(1, np.uint64), np.zeros(1, np.uint64), np.zeros((1, 1), bool), np.zeros(1))
+    _mutation_kernel(np.zeros(1, np.uint8), np.ones(1), np.zeros(1, np.int32), np.zeros(1, np.int8), 0.0, MUTATION_BASES)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -40,7 +207,7 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI(title="Viral Evolution CRISPR Targeting API")
+app = FastAPI(title="Viral Evolution CRISPR Targeting API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -88,103 +255,108 @@ class MutationSimulation(BaseModel):
 # CRISPR Analysis Engine
 class CRISPRAnalyzer:
     def __init__(self):
-        self.pam_pattern = r'[ATCG]GG'  # Cas9 PAM sequence (NGG)
-        self.target_length = 20
+        self.pam_length = 3  # Cas9 PAM sequence (NGG)
+        self.target_length = TARGET_LEN
         
-    def find_pam_sites(self, sequence: str) -> List[Tuple[int, str]]:
-        """Find all PAM sites in the sequence"""
-        pam_sites = []
-        for match in re.finditer(self.pam_pattern, sequence):
-            pam_sites.append((match.start(), match.group()))
-        return pam_sites
+    def find_pam_sites(self, seq_arr: np.ndarray) -> np.ndarray:
+        """Find the start positions of all PAM sites in an encoded sequence"""
+        if len(seq_arr) < self.pam_length:
+            return np.empty(0, dtype=np.intp)
+        mask = _IS_ACGT[seq_arr[:-2]] & (seq_arr[1:-1] == 71) & (seq_arr[2:] == 71)
+        return np.flatnonzero(mask)
     
-    def extract_target_sequences(self, sequence: str) -> List[Dict]:
-        """Extract CRISPR target sequences around PAM sites"""
-        targets = []
-        pam_sites = self.find_pam_sites(sequence)
-        
-        for pam_pos, pam_seq in pam_sites:
-            # Extract target sequence (20 bp upstream of PAM)
-            if pam_pos >= self.target_length:
-                target_start = pam_pos - self.target_length
-                target_seq = sequence[target_start:pam_pos]
-                
-                if len(target_seq) == self.target_length:
-                    targets.append({
-                        'target_sequence': target_seq,
-                        'pam_sequence': pam_seq,
-                        'position': target_start,
-                        'strand': '+',
-                        'gc_content': calculate_gc_content(target_seq)
-                    })
+    def _strand_targets(self, seq_arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return PAM positions with a full-length upstream target, the targets and the PAMs"""
+        pam_starts = self.find_pam_sites(seq_arr)
+        pam_starts = pam_starts[pam_starts >= self.target_length]
+        window = self.target_length + self.pam_length
+        if len(seq_arr) < window:
+            return pam_starts, np.empty((0, self.target_length), np.uint8), np.empty((0, self.pam_length), np.uint8)
+        windows = sliding_window_view(seq_arr, window)[pam_starts - self.target_length]
+        return pam_starts, windows[:, :self.target_length], windows[:, self.target_length:]
+    
+    def extract_target_sequences(self, seq_arr: np.ndarray) -> Dict[str, np.ndarray]:
+        """Extract CRISPR target sequences around PAM sites of an encoded sequence.
+
+        Targets are returned as parallel arrays: an (N, 20) uint8 matrix of
+        target sequences, an (N, 3) matrix of PAMs, and per-target position,
+        strand (+1/-1) and GC content.
+        """
+        fwd_pams, fwd_targets, fwd_pam_seqs = self._strand_targets(seq_arr)
         
         # Check reverse complement
-        rev_comp = str(Seq(sequence).reverse_complement())
-        pam_sites_rev = self.find_pam_sites(rev_comp)
+        rev_comp = COMPLEMENT[seq_arr][::-1].copy()
+        rev_pams, rev_targets, rev_pam_seqs = self._strand_targets(rev_comp)
         
-        for pam_pos, pam_seq in pam_sites_rev:
-            if pam_pos >= self.target_length:
-                target_start = pam_pos - self.target_length
-                target_seq = rev_comp[target_start:pam_pos]
-                
-                if len(target_seq) == self.target_length:
-                    # Convert back to original sequence coordinates
-                    orig_pos = len(sequence) - pam_pos - 3
-                    targets.append({
-                        'target_sequence': target_seq,
-                        'pam_sequence': pam_seq,
-                        'position': orig_pos,
-                        'strand': '-',
-                        'gc_content': calculate_gc_content(target_seq)
-                    })
-        
-        return targets
+        target_matrix = np.concatenate([fwd_targets, rev_targets])
+        return {
+            'target_sequence': target_matrix,
+            'pam_sequence': np.concatenate([fwd_pam_seqs, rev_pam_seqs]),
+            # Reverse strand PAMs are converted back to original sequence coordinates
+            'position': np.concatenate([fwd_pams - self.target_length, len(seq_arr) - rev_pams - self.pam_length]),
+            'strand': np.concatenate([np.ones(len(fwd_pams), np.int8), np.full(len(rev_pams), -1, np.int8)]),
+            'gc_content': ((target_matrix == 67).sum(1) + (target_matrix == 71).sum(1)) / self.target_length * 100
+        }
     
-    def calculate_conservation_score(self, target_seq: str, variant_sequences: List[str]) -> float:
-        """Calculate conservation score across viral variants"""
-        if not variant_sequences:
-            return 1.0
-        
-        conservation_scores = []
-        for variant in variant_sequences:
-            # Simple identity calculation
-            if target_seq in variant:
-                conservation_scores.append(1.0)
-            else:
-                # Calculate similarity
-                matches = sum(1 for a, b in zip(target_seq, variant[:len(target_seq)]) if a == b)
-                conservation_scores.append(matches / len(target_seq))
-        
-        return np.mean(conservation_scores)
+    def find_exact_matches(self, target_codes: np.ndarray, variant_kmers: List[FrozenSet[int]]) -> np.ndarray:
+        """Flag which packed targets occur exactly in each variant"""
+        codes = target_codes.tolist()
+        present = np.zeros((len(codes), len(variant_kmers)), dtype=bool)
+        for v, kmers in enumerate(variant_kmers):
+            present[:, v] = [code in kmers for code in codes]
+        return present
     
-    def predict_escape_probability(self, target_seq: str, gc_content: float, conservation_score: float) -> float:
-        """Predict escape probability using simple heuristics"""
-        # Higher GC content tends to be more stable
-        gc_factor = 1.0 - abs(gc_content - 50) / 50
-        
-        # Higher conservation means lower escape probability
-        conservation_factor = conservation_score
+    def score_conservation(self, targets: np.ndarray, variant_heads: np.ndarray,
+                           variant_kmers: List[FrozenSet[int]]) -> np.ndarray:
+        """Calculate conservation scores for a matrix of encoded targets.
+
+        Variants are described by their _variant_heads and _variant_kmers.
+        """
+        if not variant_kmers:
+            return np.ones(len(targets))
+        present = self.find_exact_matches(_pack_bases(targets), variant_kmers)
         
-        # Simple escape probability calculation
-        escape_prob = 1.0 - (gc_factor * 0.3 + conservation_factor * 0.7)
-        return max(0.0, min(1.0, escape_prob))
+        # Targets not found are scored by similarity to the start of each variant
+        similarity = (targets[:, None, :] == variant_heads[None, :, :]).mean(axis=2)
+        return np.where(present, 1.0, similarity).mean(axis=1)
+    
+    def count_repeats(self, targets: np.ndarray) -> np.ndarray:
+        """Count the 4-mers of each encoded target that recur further downstream"""
+        if targets.shape[1] < 8:
+            return np.zeros(len(targets), dtype=np.int64)
+        # Pack each 4-mer's bytes into a single integer key
+        keys = np.ascontiguousarray(sliding_window_view(targets, 4, axis=1)).view(np.uint32)[..., 0]
+        # Only count non-overlapping recurrences, i.e. starting at least 4 bp later
+        downstream = np.triu(np.ones((keys.shape[1], keys.shape[1]), dtype=bool), k=4)
+        repeats = (keys[:, :, None] == keys[:, None, :]) & downstream
+        return repeats.any(axis=2).sum(axis=1)
     
-    def calculate_binding_strength(self, target_seq: str) -> float:
-        """Estimate CRISPR binding strength"""
-        # Simple scoring based on sequence features
-        gc_content = calculate_gc_content(target_seq)
+    def score_all(self, targets: Dict[str, np.ndarray], conservation_scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Escape probability and binding strength for every extracted target"""
+        # Higher GC content tends to be more stable; extreme GC content weakens binding
+        gc_penalty = np.abs(targets["gc_content"] - 50) / 50
         
-        # Penalize extreme GC content
-        gc_penalty = abs(gc_content - 50) / 50
+        # Higher conservation means lower escape probability
+        escape_probs = 1.0 - ((1.0 - gc_penalty) * 0.3 + conservation_scores * 0.7)
         
         # Look for secondary structures (simplified)
-        repeat_penalty = 0
-        for i in range(len(target_seq) - 3):
-            if target_seq[i:i+4] in target_seq[i+4:]:
-                repeat_penalty += 0.1
+        repeat_penalty = self.count_repeats(targets["target_sequence"]) * 0.1
+        binding_strengths = 1.0 - gc_penalty * 0.3 - repeat_penalty * 0.2
+        return np.clip(escape_probs, 0.0, 1.0), np.clip(binding_strengths, 0.0, 1.0)
+
+    def score_targets(self, targets: Dict[str, np.ndarray], variant_heads: np.ndarray,
+                      variant_kmers: List[FrozenSet[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Conservation, escape probability and binding strength for every extracted target"""
+        target_matrix = targets["target_sequence"]
+        if not _HAS_NUMBA or not variant_kmers:
+            conservation_scores = self.score_conservation(target_matrix, variant_heads, variant_kmers)
+            return (conservation_scores,) + self.score_all(targets, conservation_scores)
         
-        binding_strength = 1.0 - gc_penalty * 0.3 - repeat_penalty * 0.2
-        return max(0.0, min(1.0, binding_strength))
+        target_codes = _pack_bases(target_matrix)
+        present = self.find_exact_matches(target_codes, variant_kmers)
+        return make_scorer(target_matrix.shape[1])(
+            target_codes, _pack_bases(variant_heads), present, targets["gc_content"]
+        )
 
 # Initialize analyzer
 crispr_analyzer = CRISPRAnalyzer()
@@ -195,6 +367,11 @@ SAMPLE_SEQUENCES = {
     "SARS-CoV-2": "ATGTTTGTTTTTCTTGTTTTATTGCCACTAGTCTCTAGTCAGTGTGTTAATCTTACAACCAGAACTCAATTACCCCCTGCATACACTAATTCTTTCACACGTGGTGTTTATTACCCTGACAAAGTTTTCAGATCCTCAGTTTTACATTCAACTCAGGACTTGTTCTTACCTTTCTTTTCCAATGTTACTTGGTTCCATGCTATACATGTCTCTGGGACCAATGGTACTAAGAGGTTTGATAACCCTGTCCTACCATTTAATGATGGTGTTTATTTTGCTTCCACTGAGAAGTCTAACATAATAAGAGGCTGGATTTTTGGTACTACTTTAGATTCGAAGACCCAGTCCCTACTTATTGTTAATAACGCTACTAATGTTGTTATTAAAGTCTGTGAATTTCAATTTTGTAATGATCCATTTTTGGGTGTTTATTACCACAAAAACAACAAAAGTTGGATGGAAAGTGAGTTCAGAGTTTATTCTAGTGCGAATAATTGCACTTTTGAATATGTCTCTCAGCCTTTTCTTATGGACCTTGAAGGAAAACAGGGTAATTTCAAAAATCTTAGGGAATTTGTGTTTAAGAATATTGATGGTTATTTTAAAATATATTCTAAGCACACGCCTATTAATTTAGGGCGTGATCTCCCTCAGGGTTTTTCGGCTTTAGAACCATTGGTAGATTTGCCAATAGGTATTAACATCACTAGGTTTCAAACTTTACTTGCTTTACATAGAAGTTATTTGACTCCTGGTGATTCTTCTTCAGGTTGGACAGCTGGTGCTGCAGCTTATTATGTGGGTTATCTTCAACCTAGGACTTTTCTATTAAAATATAATGAAAATGGAACCATTACAGATGCTGTAGACTGTGCACTTGACCCTCTCTCAGAAACAAAGTGTACGTTGAAATCCTTCACTGTAGAAAAAGGAATCTATCAAACTTCTAACTTTAGAGTCCAACCAACAGAATCTATTGTTAGATTTCCTAATATTACAAACTTGTGCCCTTTTGGTGAAGTTTTTAACGCCACCAGATTTGCATCTGTTTATGCTTGGAACAGGAAGAGAATCAGCAACTGTGTTGCTGATTATTCTGTCCTATATAATTCCGCATCATTTTCCACTTTTAAGTGTTATGGAGTGTCTCCTACTAAATTAAATGATCTCTGCTTTACTAATGTCTATGCAGATTCATTTGTAATTAGAGGTGATGAAGTCAGACAAATCGCTCCAGGGCAAACTGGAAAGATTGCTGATTATAATTATAAATTACCAGATGATTTTACAGGCTGCGTTATAGCTTGGAATTCTAACAATCTTGATTCTAAGGTTGGTGGTAATTATAATTACCTGTATAGATTGTTTAGGAAGTCTAATCTCAAACCTTTTGAGAGAGATATTTCAACTGAAATCTATCAGGCCGGTAGCACACCTTGTAATGGTGTTGAAGGTTTTAATTGTTACTTTCCTTTACAATCATATGGTTTCCAACCCACTAATGGTGTTGGTTACCAACCATACAGAGTAGTAGTACTTTCTTTTGAACTTCTACATGCACCAGCAACTGTTTGTGGACCTAAAAAGTCTACTAATTTGGTTAAAAACAAATGTGTCAATTTCAACTTCAATGGTTTAACAGGCACAGGTGTTCTTACTGAGTCTAACAAAAAGTTTCTGCCTTTCCAACAATTTGGCAGAGACATTGCTGACACTACTGATGCTGTCCGTGATCCACAGACACTTGAGATTCTTGACATTACACCATGTTCTTTTGGTGGTGTCAGTGTTATAACACCAGGAACAAATACTTCTAACCAGGTTGCTGTTCTTTATCAGGATGTTAACTGCACAGAAGTCCCTGTTGCTATTCATGCAGATCAACTTACTCCTACTTGGCGTGTTTATTCTACAGG"
 }
 
+# Encoded copies of the samples, used as the variant panel for conservation scoring
+_SAMPLES_U8 = {name: _encode_sequence(sequence) for name, sequence in SAMPLE_SEQUENCES.items()}
+_SAMPLE_HEADS = _variant_heads(list(_SAMPLES_U8.values()), TARGET_LEN)
+_SAMPLE_KMERS = _variant_kmers(list(_SAMPLES_U8.values()), TARGET_LEN)
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -205,17 +382,24 @@ async def upload_sequence(sequence_data: SequenceUpload):
     """Upload a viral sequence for analysis"""
     try:
         # Validate sequence
-        if not re.match(r'^[ATCGN]+$', sequence_data.sequence.upper()):
+        sequence = sequence_data.sequence.upper()
+        seq_arr = _encode_sequence(sequence) if sequence.isascii() else None
+        if seq_arr is None or not _is_valid_sequence(seq_arr):
             raise HTTPException(status_code=400, detail="Invalid sequence format. Only ATCGN characters allowed.")
         
         sequence_obj = ViralSequence(
             name=sequence_data.name,
-            sequence=sequence_data.sequence.upper(),
+            sequence=sequence,
             virus_type=sequence_data.virus_type
         )
         
-        # Store in database
-        await db.viral_sequences.insert_one(sequence_obj.dict())
+        # Store in database, priming the target cache from the encoded sequence
+        targets = crispr_analyzer.extract_target_sequences(seq_arr)
+        await db.viral_sequences.insert_one({
+            **sequence_obj.dict(),
+            "targets_blob": _pack_targets(targets),
+            "targets_version": TARGETS_VERSION
+        })
         return sequence_obj
     
     except Exception as e:
@@ -230,67 +414,73 @@ async def analyze_sequence(sequence_id: str):
         if not sequence_doc:
             raise HTTPException(status_code=404, detail="Sequence not found")
         
-        sequence = sequence_doc["sequence"]
-        
-        # Find CRISPR targets
-        targets = crispr_analyzer.extract_target_sequences(sequence)
-        
-        # Analyze each target
-        analyzed_targets = []
-        for target in targets:
-            conservation_score = crispr_analyzer.calculate_conservation_score(
-                target["target_sequence"], 
-                list(SAMPLE_SEQUENCES.values())
-            )
-            
-            escape_prob = crispr_analyzer.predict_escape_probability(
-                target["target_sequence"],
-                target["gc_content"],
-                conservation_score
-            )
-            
-            binding_strength = crispr_analyzer.calculate_binding_strength(
-                target["target_sequence"]
+        # Find CRISPR targets, reusing the cached scan from upload or a previous analysis
+        if sequence_doc.get("targets_version") == TARGETS_VERSION:
+            targets = _unpack_targets(sequence_doc["targets_blob"])
+        else:
+            targets = crispr_analyzer.extract_target_sequences(_encode_sequence(sequence_doc["sequence"]))
+            await db.viral_sequences.update_one(
+                {"id": sequence_id},
+                {"$set": {"targets_blob": _pack_targets(targets), "targets_version": TARGETS_VERSION}}
             )
-            
-            crispr_target = CRISPRTarget(
+        target_sequences = _decode_rows(targets["target_sequence"])
+        pam_sequences = _decode_rows(targets["pam_sequence"])
+        conservation_scores, escape_probs, binding_strengths = crispr_analyzer.score_targets(
+            targets,
+            _SAMPLE_HEADS,
+            _SAMPLE_KMERS
+        )
+        n_targets = len(target_sequences)
+        
+        # Scores are computed internally, so skip per-field validation
+        target_ids = [str(uuid.uuid4()) for _ in range(n_targets)]
+        analyzed_targets = [
+            CRISPRTarget.model_construct(
+                id=target_id,
                 sequence_id=sequence_id,
-                target_sequence=target["target_sequence"],
-                pam_sequence=target["pam_sequence"],
-                position=target["position"],
-                strand=target["strand"],
-                gc_content=target["gc_content"],
+                target_sequence=target_seq,
+                pam_sequence=pam_seq,
+                position=position,
+                strand='+' if strand > 0 else '-',
+                gc_content=gc_content,
                 conservation_score=conservation_score,
                 escape_probability=escape_prob,
                 binding_strength=binding_strength
             )
-            
-            analyzed_targets.append(crispr_target)
-            # Store target in database
-            await db.crispr_targets.insert_one(crispr_target.dict())
+            for target_id, target_seq, pam_seq, position, strand, gc_content, conservation_score, escape_prob, binding_strength
+            in zip(target_ids, target_sequences, pam_sequences, targets["position"].tolist(), targets["strand"].tolist(),
+                   targets["gc_content"].tolist(), conservation_scores.tolist(), escape_probs.tolist(), binding_strengths.tolist())
+        ]
+        
+        # Store targets in database
+        if analyzed_targets:
+            await db.crispr_targets.insert_many(
+                [t.dict() for t in analyzed_targets],
+                ordered=False
+            )
         
         # Generate analysis summary
-        high_confidence_targets = [t for t in analyzed_targets if t.escape_probability < 0.3 and t.binding_strength > 0.7]
+        high_confidence = np.flatnonzero((escape_probs < 0.3) & (binding_strengths > 0.7))
         
         recommendations = []
-        if high_confidence_targets:
-            recommendations.append(f"Found {len(high_confidence_targets)} high-confidence targets with low escape probability")
-            best_target = min(high_confidence_targets, key=lambda x: x.escape_probability)
-            recommendations.append(f"Best target: {best_target.target_sequence} (escape prob: {best_target.escape_probability:.3f})")
+        if len(high_confidence):
+            recommendations.append(f"Found {len(high_confidence)} high-confidence targets with low escape probability")
+            best = high_confidence[escape_probs[high_confidence].argmin()]
+            recommendations.append(f"Best target: {target_sequences[best]} (escape prob: {escape_probs[best]:.3f})")
         else:
             recommendations.append("No high-confidence targets found. Consider alternative approaches.")
         
         analysis_result = AnalysisResult(
             sequence_id=sequence_id,
-            total_targets=len(analyzed_targets),
-            high_confidence_targets=len(high_confidence_targets),
+            total_targets=n_targets,
+            high_confidence_targets=len(high_confidence),
             conservation_data={
-                "avg_conservation": np.mean([t.conservation_score for t in analyzed_targets]) if analyzed_targets else 0,
-                "max_conservation": max([t.conservation_score for t in analyzed_targets]) if analyzed_targets else 0
+                "avg_conservation": conservation_scores.mean() if n_targets else 0,
+                "max_conservation": conservation_scores.max() if n_targets else 0
             },
             escape_analysis={
-                "avg_escape_prob": np.mean([t.escape_probability for t in analyzed_targets]) if analyzed_targets else 0,
-                "min_escape_prob": min([t.escape_probability for t in analyzed_targets]) if analyzed_targets else 0
+                "avg_escape_prob": escape_probs.mean() if n_targets else 0,
+                "min_escape_prob": escape_probs.min() if n_targets else 0
             },
             recommendations=recommendations
         )
@@ -309,8 +499,21 @@ async def analyze_sequence(sequence_id: str):
 @api_router.get("/sequence/{sequence_id}/targets")
 async def get_targets(sequence_id: str):
     """Get CRISPR targets for a sequence"""
-    targets = await db.crispr_targets.find({"sequence_id": sequence_id}).to_list(1000)
-    return targets
+    cursor = db.crispr_targets.find({"sequence_id": sequence_id}, {"_id": 0}).limit(1000)
+    
+    async def stream_targets():
+        yield b"["
+        first = True
+        while True:
+            batch = await cursor.to_list(200)
+            if not batch:
+                break
+            # Splice the batch's elements into the enclosing JSON array
+            yield (b"" if first else b",") + orjson.dumps(batch)[1:-1]
+            first = False
+        yield b"]"
+    
+    return StreamingResponse(stream_targets(), media_type="application/json")
 
 @api_router.get("/samples")
 async def get_sample_sequences():
@@ -334,25 +537,54 @@ async def load_sample_sequence(virus_type: str):
 @api_router.post("/simulate/mutation")
 async def simulate_mutations(simulation: MutationSimulation):
     """Simulate viral mutations"""
+    # Checked before the try block so the 400 is not turned into a 500
+    if not simulation.original_sequence.isascii():
+        raise HTTPException(status_code=400, detail="Invalid sequence format. Only ASCII characters allowed.")
+
     try:
         sequence = simulation.original_sequence
-        mutations = []
+        generations = max(simulation.generations, 0)
+        if not sequence or not generations:
+            return {
+                "original_sequence": sequence,
+                "mutated_sequence": sequence,
+                "mutations": [],
+                "mutation_count": 0
+            }
         
-        for gen in range(simulation.generations):
-            if np.random.random() < simulation.mutation_rate:
-                # Random mutation
-                pos = np.random.randint(0, len(sequence))
-                old_base = sequence[pos]
-                new_base = np.random.choice(['A', 'T', 'C', 'G'])
-                
-                if old_base != new_base:
-                    sequence = sequence[:pos] + new_base + sequence[pos+1:]
-                    mutations.append({
-                        "generation": gen,
-                        "position": pos,
-                        "from": old_base,
-                        "to": new_base
-                    })
+        # Draw the random numbers for every generation up front
+        draws = _RNG.random(generations)
+        positions = _RNG.integers(0, len(sequence), generations, dtype=np.int32)
+        base_choices = _RNG.integers(0, len(MUTATION_BASES), generations, dtype=np.int8)
+        
+        # Mutate a single buffer in place and decode it once at the end
+        buf = bytearray(sequence, 'ascii')
+        if _HAS_NUMBA:
+            events = _mutation_kernel(np.frombuffer(buf, dtype=np.uint8), draws, positions, base_choices,
+                                      simulation.mutation_rate, MUTATION_BASES)
+            mutations = [
+                {"generation": gen, "position": pos, "from": chr(old_base), "to": chr(new_base)}
+                for gen, pos, old_base, new_base in events.tolist()
+            ]
+        else:
+            mutations = []
+            for gen in range(generations):
+                if draws[gen] < simulation.mutation_rate:
+                    # Random mutation
+                    pos = int(positions[gen])
+                    old_base = buf[pos]
+                    new_base = int(MUTATION_BASES[base_choices[gen]])
+                    
+                    if old_base != new_base:
+                        buf[pos] = new_base
+                        mutations.append({
+                            "generation": gen,
+                            "position": pos,
+                            "from": chr(old_base),
+                            "to": chr(new_base)
+                        })
+        
+        sequence = buf.decode('ascii')
         
         return {
             "original_sequence": simulation.original_sequence,
@@ -0,0 +1,99 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+
+
+# Scalar reference: the original per-target string heuristics
+def reference_scores(target_seq, variant_sequences):
+    if not variant_sequences:
+        conservation = 1.0
+    else:
+        per_variant = []
+        for variant in variant_sequences:
+            if target_seq in variant:
+                per_variant.append(1.0)
+            else:
+                matches = sum(1 for a, b in zip(target_seq, variant[:len(target_seq)]) if a == b)
+                per_variant.append(matches / len(target_seq))
+        conservation = np.mean(per_variant)
+
+    gc_content = (target_seq.count('G') + target_seq.count('C')) / len(target_seq) * 100
+    gc_penalty = abs(gc_content - 50) / 50
+    escape = 1.0 - ((1.0 - gc_penalty) * 0.3 + conservation * 0.7)
+
+    repeat_penalty = 0
+    for i in range(len(target_seq) - 3):
+        if target_seq[i:i+4] in target_seq[i+4:]:
+            repeat_penalty += 0.1
+    binding = 1.0 - gc_penalty * 0.3 - repeat_penalty * 0.2
+    return conservation, max(0.0, min(1.0, escape)), max(0.0, min(1.0, binding))
+
+
+def make_targets(target_seqs):
+    matrix = np.array([list(seq.encode('ascii')) for seq in target_seqs], dtype=np.uint8).reshape(-1, server.TARGET_LEN)
+    gc_content = ((matrix == ord('G')).sum(1) + (matrix == ord('C')).sum(1)) / server.TARGET_LEN * 100
+    return {'target_sequence': matrix, 'gc_content': gc_content}
+
+
+TARGETS = [
+    'ATGGGTGCGAGAGCGTCAGT',  # start of the HIV-1 sample
+    'GCGAGAGCGTCAGTATTAAG',  # inside the HIV-1 sample
+    'ACGTNACGTNACGTNACGTN',  # N bases
+    'NNNNNNNNNNNNNNNNNNNN',
+    'ATATATATATATATATATAT',  # repeat heavy
+    'AAAAAAAAAAAAAAAAAAAA',
+    'GGGGGGGGGGGGGGGGGGGG',
+    'CAGTCAGTCAGTCAGTCAGT',
+    'TTTTGGGGCCCCAAAATTTT',
+]
+
+VARIANT_SETS = {
+    'samples': list(server.SAMPLE_SEQUENCES.values()),
+    'short': ['ATGGGTGCGA', 'ACGTN', 'A', 'AAAAAAAAAAAAAAAAAAA'],
+    'mixed': ['NNNNACGTNACGTNACGTNACGTNNNN', 'ATGGG', server.SAMPLE_SEQUENCES['HIV-1'][:300], 'ATATATATATATATATATATAT'],
+    'none': [],
+}
+
+NUMBA_MODES = [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(not server._HAS_NUMBA, reason='numba not installed')),
+]
+
+
+@pytest.mark.parametrize('use_numba', NUMBA_MODES)
+@pytest.mark.parametrize('variant_set', sorted(VARIANT_SETS))
+@pytest.mark.parametrize('target_seqs', [TARGETS, []], ids=['targets', 'no-targets'])
+def test_score_targets_matches_reference(monkeypatch, use_numba, variant_set, target_seqs):
+    monkeypatch.setattr(server, '_HAS_NUMBA', use_numba)
+    variants = VARIANT_SETS[variant_set]
+    variant_arrays = [server._encode_sequence(v) for v in variants]
+
+    conservation, escape, binding = server.crispr_analyzer.score_targets(
+        make_targets(target_seqs),
+        server._variant_heads(variant_arrays, server.TARGET_LEN),
+        server._variant_kmers(variant_arrays, server.TARGET_LEN),
+    )
+
+    expected = np.array([reference_scores(seq, variants) for seq in target_seqs]).reshape(-1, 3)
+    np.testing.assert_allclose(conservation, expected[:, 0])
+    np.testing.assert_allclose(escape, expected[:, 1])
+    np.testing.assert_allclose(binding, expected[:, 2])
+
+
+def test_overlapping_pam_sites():
+    assert server.crispr_analyzer.find_pam_sites(server._encode_sequence('AGGG')).tolist() == [0, 1]
+    assert server.crispr_analyzer.find_pam_sites(server._encode_sequence('NGGG')).tolist() == [1]
+
+    targets = server.crispr_analyzer.extract_target_sequences(server._encode_sequence('ATATATATATATATATATAT' + 'AGGG'))
+    forward = targets['strand'] == 1
+    assert targets['position'][forward].tolist() == [0, 1]
+    assert server._decode_rows(targets['pam_sequence'][forward]) == ['AGG', 'GGG']